@@ -8,20 +8,88 @@ This module provides:
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import time
+from typing import TYPE_CHECKING, ClassVar
+from weakref import WeakKeyDictionary
 
 from flask.sessions import SecureCookieSession, SecureCookieSessionInterface
 from flask_redisdict import RedisDict
-from redis import Redis
+from redis import Redis, RedisError
 
 if TYPE_CHECKING:
-    from collections.abc import Sequence
+    from collections.abc import Iterable, Iterator, Mapping, Sequence
 
     from flask import Flask, Request, Response, SessionMixin
     from redis import Pipeline
+    from redis.commands.core import Script
 
 
 SHADOW_KEY_NAME = "shadow_key"
+SHADOW_REFRESHED_NAME = "shadow_refreshed"
+
+# The session cookie is re-signed and the hash TTL refreshed at most once per this fraction of the session lifetime
+TTL_REFRESH_INTERVAL = 0.1
+
+# Clock for refresh intervals, separate from `time.time` so it can be replaced without affecting cookie signing
+_clock = time.time
+
+# Number of candidate keys checked when creating a hash, and how many are checked per round-trip
+CREATE_HASH_ATTEMPTS = 96
+CREATE_HASH_BATCH_SIZE = 16
+
+# Claim the first candidate key in KEYS[2..] that does not exist and return its (1-based) index among the
+# candidates, or 0 if they all exist. The existing hash KEYS[1] (empty if none) is renamed to the claimed key,
+# otherwise the field ARGV[2] (if any) is set to ARGV[3] so the key exists (is reserved) as soon as it is claimed.
+# TTL is set to ARGV[1] (if any).
+CLAIM_KEY_SCRIPT = """
+for i = 2, #KEYS do
+    local key = KEYS[i]
+    if redis.call('EXISTS', key) == 0 then
+        if KEYS[1] ~= '' and redis.call('EXISTS', KEYS[1]) == 1 then
+            redis.call('RENAME', KEYS[1], key)
+        elseif ARGV[2] then
+            redis.call('HSET', key, ARGV[2], ARGV[3])
+        end
+        if ARGV[1] ~= '' then
+            redis.call('EXPIRE', key, ARGV[1])
+        end
+        return i - 1
+    end
+end
+return 0
+"""
+
+# Refresh hash TTL only if it still exists; ARGV[1] is TTL in seconds
+EXPIRE_IF_EXISTS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# Per-field hash TTL (HEXPIRE) support, detected once per Redis client
+_hexpire_support: WeakKeyDictionary[Redis, bool] = WeakKeyDictionary()
+
+
+def _supports_hexpire(redis: Redis) -> bool:
+    """Determine whether the Redis server supports per-field hash TTL (added in Redis 7.4).
+
+    Arguments:
+        redis (Redis): Redis instance.
+
+    Returns:
+        bool: True if ``HEXPIRE`` is available.
+    """
+    rv = _hexpire_support.get(redis)
+    if rv is None:
+        try:
+            # Reply has an entry per command, None if it is unknown (a map with RESP3)
+            info = redis.execute_command("COMMAND INFO", "HEXPIRE")
+            rv = any(info.values() if isinstance(info, dict) else info)
+        except RedisError:
+            rv = False
+        _hexpire_support[redis] = rv
+    return rv
 
 
 class ShadowSessionDict(RedisDict):
@@ -32,14 +100,57 @@ class ShadowSessionDict(RedisDict):
 
     Note:
         We only create the hash in Redis when the first key in the shadow session is accessed.
+
+    Note:
+        Writes and deletes are buffered and sent to Redis in a single pipeline when the session is saved.
+        Once the session has been saved (e.g. in ``teardown_request`` handlers) they are sent immediately.
     """
 
+    # Slots cover the attributes this class adds; RedisDict attributes (`redis`, `key`, `max_age`) are left to the base class.
+    __slots__ = (
+        "_exists_cache",
+        "_field_ttl",
+        "_pending_deletes",
+        "_pending_writes",
+        "_saved",
+        "accessed",
+        "session",
+    )
+
+    field_max_age: ClassVar[dict[str, int]] = {}
+    """Per-field TTL in seconds for fields that should expire before the hash; requires Redis 7.4+ and is ignored otherwise."""
+
+    # Set by `__init_subclass__` for subclasses that override `_on_create_hash` and `_on_save_session`
+    _has_on_create_hash: bool = False
+    _has_on_save_session: bool = False
+
+    # Lua scripts shared by all instances, registered on first use
+    _expire_script: ClassVar[Script | None] = None
+    _claim_key_script: ClassVar[Script | None] = None
+
+    # Bind base class methods once to avoid resolving them on every access
+    _base_getitem = RedisDict.__getitem__
+    _base_contains = RedisDict.__contains__
+    _base_iter = RedisDict.__iter__
+    _base_len = RedisDict.__len__
+
     def __init__(self, *args, **kwargs) -> None:
         """Constructor."""
         super().__init__(*args, **kwargs)
 
         self.session = None
         self.accessed = False
+        self._exists_cache = None
+        self._field_ttl = False
+        self._pending_writes: dict[str, str | bytes] = {}  # serialized values
+        self._pending_deletes: set[str] = set()
+        self._saved = False
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """Note whether subclass queues commands on create or save so we can avoid building a pipeline."""
+        super().__init_subclass__(**kwargs)
+        cls._has_on_create_hash = cls._on_create_hash is not ShadowSessionDict._on_create_hash
+        cls._has_on_save_session = cls._on_save_session is not ShadowSessionDict._on_save_session
 
     def open_session(self, session: ShadowSession, redis: Redis, max_age: int | None) -> None:
         """Initialize shadow session.
@@ -51,48 +162,76 @@ class ShadowSessionDict(RedisDict):
 
         Raises:
             ValueError: Session or Redis instance has not been set.
-            TypeError: Session or Redis instance is not of correct type.
+            TypeError: Session or Redis instance is not of correct type (unless optimizations are enabled).
 
         Note:
             Called automatically on request setup.
         """
-        if not session:
+        if session is None:
             errmsg = f"{self!r}:open_session: 'session' is required"
             raise ValueError(errmsg)
-        if not isinstance(session, ShadowSession):
-            errmsg = f"{self!r} session instance is type <{session.__class__.__name__}> expected type <ShadowSession>"
-            raise TypeError(errmsg)
-
         if not redis:
             errmsg = f"{self!r}:open_session: 'redis' is required"
             raise ValueError(errmsg)
-        if not isinstance(redis, Redis):
-            errmsg = f"{self!r} redis instance is type <{redis.__class__.__name__}> expected type <Redis>"
-            raise TypeError(errmsg)
+
+        # Type checks are developer assertions; skip them on every request when run with `python -O`
+        if __debug__:
+            if not isinstance(session, ShadowSession):
+                errmsg = f"{self!r} session instance is type <{session.__class__.__name__}> expected type <ShadowSession>"
+                raise TypeError(errmsg)
+            if not isinstance(redis, Redis):
+                errmsg = f"{self!r} redis instance is type <{redis.__class__.__name__}> expected type <Redis>"
+                raise TypeError(errmsg)
 
         self.session = session
         self.accessed = False
+        if ShadowSessionDict._expire_script is None:
+            # Register scripts once; they are invoked with each session's own client
+            ShadowSessionDict._expire_script = redis.register_script(EXPIRE_IF_EXISTS_SCRIPT)
+            ShadowSessionDict._claim_key_script = redis.register_script(CLAIM_KEY_SCRIPT)
+        self._exists_cache = None
+        self._field_ttl = bool(self.field_max_age) and _supports_hexpire(redis)
+        self._pending_writes = {}
+        self._pending_deletes = set()
+        self._saved = False
 
         # RedisDict instance attributes
         self.redis = redis
         self.key = session.get(SHADOW_KEY_NAME, None)
         self.max_age = max_age
 
-    def save_session(self, session: ShadowSession) -> None:  # noqa: ARG002
-        """Update session last access date and TTL.
+    def save_session(self, session: ShadowSession, refresh_ttl: bool = True) -> None:  # noqa: ARG002
+        """Write buffered changes and update session last access date and TTL.
 
         Arguments:
             session (ShadowSession): App session.
+            refresh_ttl (bool): Refresh the hash TTL even if there are no buffered changes to write.
 
         Note:
-            Called automatically on request teardown.
+            Called automatically on request teardown, before the session cookie is saved.
         """
-        if self.accessed is True and self.key is not None:
+        has_pending = bool(self._pending_writes or self._pending_deletes)
+        if has_pending:
+            self._check_state()  # create hash key if necessary
+
+        # Nothing flushes the buffer after this, so later writes must not be buffered
+        self._saved = True
+
+        if self.key is None:
+            return
+
+        refresh_ttl = self.max_age is not None and (refresh_ttl or has_pending)
+
+        if has_pending or (self.accessed is True and self._has_on_save_session):
             p = self.redis.pipeline()
+            self._queue_pending(p)
             self._on_save_session(p)
-            if self.max_age is not None:
+            if refresh_ttl:
                 p.expire(self.key, self.max_age)
             p.execute()
+        elif refresh_ttl:
+            # Nothing else to save, refresh TTL with a single command
+            self._expire_script(keys=[self.key], args=[self.max_age], client=self.redis)
 
     def regenerate_key(self) -> str:
         """Generate a new hash key for this shadow session.
@@ -103,6 +242,7 @@ class ShadowSessionDict(RedisDict):
         Returns:
             string: New hash key
         """
+        self._flush_pending()
         return self._create_hash()
 
     def _create_hash(self) -> str:
@@ -110,6 +250,11 @@ class ShadowSessionDict(RedisDict):
 
         Resets hash key TTL to `max_age`.
 
+        Note:
+            A new hash is created together with one of the buffered writes (which is written again when the buffer
+            is flushed) so the key is reserved atomically when it is claimed. A hash created with nothing buffered
+            stays empty until its first write, so its uniqueness relies on the entropy of `_generate_key`.
+
         Raises:
             ValueError: Hash could not be created.
 
@@ -117,40 +262,34 @@ class ShadowSessionDict(RedisDict):
             str: New hash key.
         """
         new_key = None
-        reserve_key = None
-
-        # Attempt to generate a new unique key
-        for _ in range(100):
-            possible_key = self._generate_key()
-            reserve_key = possible_key + "-reserved"
-            if self.redis.setnx(reserve_key, 1):
-                if not self.redis.exists(possible_key):
-                    new_key = possible_key
-                    break
-                self.redis.delete(reserve_key)
-            else:
-                # Someone else is trying to reserve this key!
-                reserve_key = None
+        old_key = self.key
+        args = [self.max_age or ""]
+        if self._pending_writes:
+            args += next(iter(self._pending_writes.items()))
+
+        # Attempt to generate a new unique key, checking a batch of candidates per round-trip.
+        # The script claims the key, renames an existing hash and sets its TTL in one atomic call.
+        for _ in range(CREATE_HASH_ATTEMPTS // CREATE_HASH_BATCH_SIZE):
+            candidates = [self._generate_key() for _ in range(CREATE_HASH_BATCH_SIZE)]
+            i = self._claim_key_script(keys=[old_key or "", *candidates], args=args, client=self.redis)
+            if i:
+                new_key = candidates[i - 1]
+                break
 
         if new_key is None:
-            errmsg = "Failed to generate unique shadow session key in 100 attempts."
+            errmsg = f"Failed to generate unique shadow session key in {CREATE_HASH_ATTEMPTS} attempts."
             raise ValueError(errmsg)
 
-        p = self.redis.pipeline()
+        self.key = new_key
 
-        if self.key is None:
-            self.key = new_key
+        if old_key is None and self._has_on_create_hash:
+            p = self.redis.pipeline()
             self._on_create_hash(p)
-        else:
-            p.renamenx(self.key, new_key)
-            self.key = new_key
-
-        if self.max_age is not None:
-            p.expire(self.key, self.max_age)
-        if reserve_key is not None:
-            p.delete(reserve_key)
+            if self.max_age is not None:
+                p.expire(self.key, self.max_age)
+            p.execute()
 
-        p.execute()
+        self._exists_cache = None
 
         # Carry around the shadow key in the session cookie
         self.session[SHADOW_KEY_NAME] = self.key
@@ -159,39 +298,152 @@ class ShadowSessionDict(RedisDict):
 
     def __getitem__(self, name: str) -> str | int | dict | Sequence:
         """Override base class."""
+        # Shadow access does not mark the session cookie modified; that only matters for permanent sessions
+        # and `ShadowSessionInterface.open_session` forces `permanent = False`.
         self.accessed = True
-        self.session.modified = True  # only applicable to permanent sessions
-        return super().__getitem__(name)
+        if name in self._pending_writes:
+            return self._deserialize(self._pending_writes[name])
+        if name in self._pending_deletes or self.key is None:
+            raise KeyError(name)
+        return self._base_getitem(name)
 
     def __setitem__(self, name: str, value: str | int | dict | Sequence) -> None:
-        """Override base class."""
+        """Override base class to buffer the write until the session is saved.
+
+        Note:
+            The value is serialized immediately, so later changes to it are not saved.
+        """
+        self.accessed = True
+        self._pending_deletes.discard(name)
+        self._pending_writes[name] = self._serialize(value)
+        if self._saved:
+            self._flush_pending()
+
+    def update(self, other: Mapping | Iterable[tuple[str, str | int | dict | Sequence]] = (), /, **kwargs) -> None:
+        """Set multiple fields at once.
+
+        Prefer this to setting fields one at a time in a loop; the fields are buffered together
+        and written to Redis with a single ``HSET`` when the session is saved.
+        """
         self.accessed = True
-        self.session.modified = True  # only applicable to permanent sessions
-        super().__setitem__(name, value)
+        items = {name: self._serialize(value) for name, value in dict(other, **kwargs).items()}
+        self._pending_deletes.difference_update(items)
+        self._pending_writes.update(items)
+        if self._saved:
+            self._flush_pending()
 
     def __delitem__(self, name: str) -> None:
+        """Override base class to buffer the delete until the session is saved.
+
+        Note:
+            Deleting a field that does not exist does not raise ``KeyError``.
+        """
+        self.accessed = True
+        self._pending_writes.pop(name, None)
+        if self.key is not None:
+            self._pending_deletes.add(name)
+            if self._saved:
+                self._flush_pending()
+
+    def __contains__(self, name: str) -> bool:
+        """Override base class."""
+        if name in self._pending_writes:
+            return True
+        if name in self._pending_deletes or self.key is None:
+            return False
+        return self._base_contains(name)
+
+    def __iter__(self) -> Iterator[str]:
         """Override base class."""
+        self._flush_pending()
+        return self._base_iter()
+
+    def __len__(self) -> int:
+        """Override base class."""
+        self._flush_pending()
+        return self._base_len()
+
+    def pop(self, name: str, *args) -> str | int | dict | Sequence:
+        """Override base class to fetch and remove the field in a single round-trip."""
         self.accessed = True
-        self.session.modified = True  # only applicable to permanent sessions
-        super().__delitem__(name)
+
+        if name in self._pending_writes:
+            if self.key is not None:
+                self._pending_deletes.add(name)  # field may also exist in Redis
+            return self._deserialize(self._pending_writes.pop(name))
+
+        value = None
+        if self.key is not None and name not in self._pending_deletes:
+            p = self.redis.pipeline()
+            p.hget(self.key, name)
+            p.hdel(self.key, name)
+            value, _ = p.execute()
+            self._exists_cache = None  # hash is removed with its last field
+
+        if value is None:
+            if args:
+                return args[0]
+            raise KeyError(name)
+
+        return self._deserialize(value)
 
     def exists(self) -> bool:
-        """Override base class."""
-        rv = super().exists()
-        if not rv and SHADOW_KEY_NAME in self.session:
-            # Remove shadow key from the session cookie
-            del self.session[SHADOW_KEY_NAME]
+        """Override base class.
+
+        Note:
+            The result is cached for the remainder of the request.
+        """
+        if self.key is None:
+            return False
+
+        if self._exists_cache is None:
+            self._exists_cache = bool(super().exists())
+
+        rv = self._exists_cache
         if not rv:
+            # Remove shadow key from the session cookie
+            self.session.pop(SHADOW_KEY_NAME, None)
             self.key = None  # recreate hash when next accessed
+            self._pending_deletes.clear()  # nothing left to delete; must not recreate the hash on save
         return rv
 
     def delete(self) -> None:
         """Override base class."""
         super().delete()
-        if SHADOW_KEY_NAME in self.session:
-            # Remove shadow key from the session cookie
-            del self.session[SHADOW_KEY_NAME]
+        # Remove shadow key from the session cookie
+        self.session.pop(SHADOW_KEY_NAME, None)
         self.key = None  # recreate hash when next accessed
+        self._exists_cache = None
+        self._pending_writes.clear()
+        self._pending_deletes.clear()
+
+    def _flush_pending(self) -> None:
+        """Write buffered changes to Redis.
+
+        Note:
+            Invalidates the cached `exists` result, see `_queue_pending`.
+        """
+        if self._pending_writes or self._pending_deletes:
+            self._check_state()
+            p = self.redis.pipeline()
+            self._queue_pending(p)
+            if self.max_age is not None:
+                # Writes may recreate an expired hash; TTL refresh on save may be skipped
+                p.expire(self.key, self.max_age)
+            p.execute()
+
+    def _queue_pending(self, p: Pipeline) -> None:
+        """Queue buffered changes to a pipeline and reset the buffer."""
+        self._exists_cache = None  # writes may create the hash and deletes may remove it
+        if self._pending_writes:
+            p.hset(self.key, mapping=self._pending_writes)
+            if self._field_ttl:
+                for name in self._pending_writes.keys() & self.field_max_age.keys():
+                    p.hexpire(self.key, self.field_max_age[name], name)
+            self._pending_writes.clear()
+        if self._pending_deletes:
+            p.hdel(self.key, *self._pending_deletes)
+            self._pending_deletes.clear()
 
     def _on_create_hash(self, p: Pipeline) -> None:
         """Update the hash as being created."""
@@ -216,11 +468,20 @@ class ShadowSession(SecureCookieSession):
         The app ``session`` object is an instance of this class.
     """
 
+    __slots__ = ("shadow",)
+
     shadowdict_class: type[ShadowSessionDict] = ShadowSessionDict
 
     # Force some fields that Flask normally stores in the session cookie to be saved in the shadow.
     _force_shadow_fields = frozenset(("_flashes",))
 
+    # Bind base class methods once to avoid resolving them on every access
+    _super_getitem = SecureCookieSession.__getitem__
+    _super_setitem = SecureCookieSession.__setitem__
+    _super_delitem = SecureCookieSession.__delitem__
+    _super_contains = SecureCookieSession.__contains__
+    _super_pop = SecureCookieSession.pop
+
     def __init__(self, *args, **kwargs) -> None:
         """Constructor."""
         super().__init__(*args, **kwargs)
@@ -229,35 +490,35 @@ class ShadowSession(SecureCookieSession):
 
     def __getitem__(self, name: str) -> str | int | dict | Sequence:
         """Override base class."""
-        if name not in ShadowSession._force_shadow_fields:
-            return super().__getitem__(name)
-        return self.shadow[name]
+        if name in self._force_shadow_fields:
+            return self.shadow[name]
+        return self._super_getitem(name)
 
     def __setitem__(self, name: str, value: str | int | dict | Sequence) -> None:
         """Override base class."""
-        if name not in ShadowSession._force_shadow_fields:
-            super().__setitem__(name, value)
-        else:
+        if name in self._force_shadow_fields:
             self.shadow[name] = value
+        else:
+            self._super_setitem(name, value)
 
     def __delitem__(self, name: str) -> None:
         """Override base class."""
-        if name not in ShadowSession._force_shadow_fields:
-            super().__delitem__(name)
-        else:
+        if name in self._force_shadow_fields:
             del self.shadow[name]
+        else:
+            self._super_delitem(name)
 
     def __contains__(self, name: str) -> bool:
         """Override base class."""
-        if name not in ShadowSession._force_shadow_fields:
-            return super().__contains__(name)
-        return self.shadow.__contains__(name)
+        if name in self._force_shadow_fields:
+            return self.shadow.__contains__(name)
+        return self._super_contains(name)
 
     def pop(self, name: str, *args) -> str | int | dict | Sequence:
         """Override base class."""
-        if name not in ShadowSession._force_shadow_fields:
-            return super().pop(name, *args)
-        return self.shadow.pop(name, *args)
+        if name in self._force_shadow_fields:
+            return self.shadow.pop(name, *args)
+        return self._super_pop(name, *args)
 
 
 class ShadowSessionInterface(SecureCookieSessionInterface):
@@ -277,6 +538,8 @@ class ShadowSessionInterface(SecureCookieSessionInterface):
         super().__init__(*args, **kwargs)
 
         self.max_age = None
+        self._app_lifetime = None
+        self._app_max_age = None
 
     def open_session(self, app: Flask, request: Request) -> SecureCookieSession | None:
         """Override base class.
@@ -293,25 +556,46 @@ class ShadowSessionInterface(SecureCookieSessionInterface):
             return None
 
         # The browser will delete the session cookie when it closes. To prevent a cookie from being illegally saved
-        # and replayed, our base class automatically encodes it with a max_age so it will not be honored
-        # after the duration set in config['PERMANENT_SESSION_LIFETIME'].
+        # and replayed, our base class signs it with a timestamp and will not honor it once it is older than
+        # config['PERMANENT_SESSION_LIFETIME']; `save_session` re-signs it once per refresh interval so the
+        # timeout slides while the session is in use.
         # This setting also defines the TTL of the the shadow session in Redis.
-        session.permanent = False
+        # Only assign when necessary, assignment marks the session modified which forces the cookie to be re-signed.
+        if session.permanent:
+            session.permanent = False
 
-        max_age = self.max_age or int(app.permanent_session_lifetime.total_seconds()) or None
+        max_age = self.max_age or self._get_app_max_age(app)
 
         session.shadow.open_session(session, self.redis, max_age)
 
         return session
 
+    def _get_app_max_age(self, app: Flask) -> int | None:
+        """Get shadow session TTL from `app.permanent_session_lifetime`, converted once and cached until it changes."""
+        lifetime = app.permanent_session_lifetime
+        if lifetime != self._app_lifetime:
+            self._app_lifetime = lifetime
+            self._app_max_age = int(lifetime.total_seconds()) or None
+        return self._app_max_age
+
     def save_session(self, app: Flask, session: SessionMixin, response: Response) -> None:
         """Override base class.
 
         Note:
             Called automatically on request teardown.
         """
+        # Re-sign the cookie and refresh the shadow TTL at most once per interval, whether or not the shadow was
+        # accessed; carry around when that last happened in the session cookie so other requests leave it unchanged
+        now = int(_clock())
+        lifetimes = [v for v in (self._get_app_max_age(app), session.shadow.max_age) if v]
+        interval = min(lifetimes) * TTL_REFRESH_INTERVAL if lifetimes else 0
+        refresh = now - dict.get(session, SHADOW_REFRESHED_NAME, 0) >= interval
+
+        # Write shadow session changes and update TTL; this may add the shadow key to the session cookie
+        session.shadow.save_session(session, refresh_ttl=refresh)
+
+        if refresh and session:
+            session[SHADOW_REFRESHED_NAME] = now
+
         # Save default signed session cookie
         super().save_session(app, session, response)
-
-        # Update shadow session TTL
-        session.shadow.save_session(session)
@@ -4,7 +4,7 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from flask import Flask, flash
+from flask import Flask, flash, session
 
 from flask_shadowsession import ShadowSessionInterface
 
@@ -34,6 +34,11 @@ def create_app(test_config: Mapping | None = None) -> Flask:
     def _hello() -> str:
         return "Hello, World!"
 
+    @app.route("/shadow")
+    def _shadow() -> str:
+        session.shadow["value"] = session.shadow.get("value", 0) + 1
+        return str(session.shadow["value"])
+
     @app.route("/flash")
     def _flash() -> str:
         flash("This is a message")
@@ -2,14 +2,19 @@
 
 from __future__ import annotations
 
+import time
+from datetime import timedelta
 from typing import TYPE_CHECKING
 
 import pytest
+from flask import session as app_session
 
-from flask_shadowsession import ShadowSession, ShadowSessionInterface
+from flask_shadowsession import ShadowSession, ShadowSessionDict, ShadowSessionInterface
+from flask_shadowsession import flask_shadowsession as shadowsession_module
 
 if TYPE_CHECKING:
     from fakeredis import FakeRedis
+    from flask import Flask
     from flask.testing import FlaskClient
 
 
@@ -66,3 +71,276 @@ def test_flash(client: FlaskClient, redis_client: FakeRedis) -> None:
         assert flashes == [("message", "This is a message")]
 
     assert len(session.shadow) == 0
+
+
+def test_regenerate_key(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow["shadow_value"] = 43
+
+    with client.session_transaction() as session:
+        old_key = session.shadow.key
+        new_key = session.shadow.regenerate_key()
+        assert new_key != old_key
+        assert session["shadow_key"] == new_key
+
+    # No auxiliary keys are created to reserve the new key
+    assert redis_client.keys() == [new_key.encode()]
+
+    with client.session_transaction() as session:
+        assert session.shadow["shadow_value"] == 43
+
+
+def test_session_ttl(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow["shadow_value"] = 43
+
+    assert redis_client.ttl(session.shadow.key) > 0
+
+
+def test_session_pop(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow["shadow_value"] = 43
+
+    with client.session_transaction() as session:
+        assert session.shadow.pop("shadow_value") == 43
+        assert session.shadow.pop("shadow_value", None) is None
+        with pytest.raises(KeyError):
+            session.shadow.pop("shadow_value")
+        assert len(session.shadow) == 0
+
+
+def test_session_buffered_writes(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow["a"] = 1
+        session.shadow["b"] = 2
+        del session.shadow["b"]
+        assert session.shadow["a"] == 1
+        assert "b" not in session.shadow
+        assert session.shadow.key is None  # nothing sent to Redis yet
+
+    with client.session_transaction() as session:
+        assert dict(session.shadow) == {"a": 1}
+
+    # Buffered values are serialized when set, so later changes are not saved
+    with client.session_transaction() as session:
+        value = [1]
+        session.shadow["c"] = value
+        value.append(2)
+        assert session.shadow["c"] == [1]
+
+    with client.session_transaction() as session:
+        assert session.shadow["c"] == [1]
+
+
+def test_session_write_after_save(app: Flask, client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    @app.teardown_request
+    def _teardown(_exc: BaseException | None) -> None:
+        app_session.shadow["from_teardown"] = 1
+
+    client.get("/shadow")
+
+    # Writes after the session is saved are not buffered
+    with client.session_transaction() as session:
+        assert dict(session.shadow) == {"value": 1, "from_teardown": 1}
+
+
+def test_session_ttl_refresh_interval(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow["shadow_value"] = 43
+
+    refreshed = session["shadow_refreshed"]
+    redis_client.expire(session.shadow.key, 60)
+
+    # Read-only access soon after a refresh does not touch the TTL
+    with client.session_transaction() as session:
+        assert session.shadow["shadow_value"] == 43
+
+    assert session["shadow_refreshed"] == refreshed
+    assert redis_client.ttl(session.shadow.key) <= 60
+
+
+def test_shadow_write_keeps_cookie(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    response = client.get("/shadow")
+    assert response.data == b"1"
+    assert "Set-Cookie" in response.headers  # shadow key added to cookie
+
+    # Changing only the shadow does not re-sign the session cookie
+    response = client.get("/shadow")
+    assert response.data == b"2"
+    assert "Set-Cookie" not in response.headers
+
+
+def test_cookie_sliding_timeout(client: FlaskClient, redis_client: FakeRedis, monkeypatch: pytest.MonkeyPatch) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    response = client.get("/shadow")
+    assert "Set-Cookie" in response.headers
+
+    with client.session_transaction() as session:
+        key = session.shadow.key
+    redis_client.expire(key, 60)
+
+    response = client.get("/hello")
+    assert "Set-Cookie" not in response.headers
+
+    # Once the refresh interval has passed, any request re-signs the cookie and refreshes the shadow TTL
+    later = time.time() + client.application.permanent_session_lifetime.total_seconds() / 2
+    monkeypatch.setattr(shadowsession_module, "_clock", lambda: later)
+
+    response = client.get("/hello")
+    assert "Set-Cookie" in response.headers
+    assert redis_client.ttl(key) > 60
+
+
+def test_session_update(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow.update({"a": 1, "b": 2}, c=3)
+
+    with client.session_transaction() as session:
+        assert dict(session.shadow) == {"a": 1, "b": 2, "c": 3}
+
+
+def test_session_exists(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        assert not session.shadow.exists()  # no shadow key, no Redis call
+        session.shadow["shadow_value"] = 43
+
+    with client.session_transaction() as session:
+        assert session.shadow.exists()
+        session.shadow.pop("shadow_value")
+        assert not redis_client.exists(session.shadow.key)
+        assert not session.shadow.exists()
+        assert "shadow_key" not in session
+
+    with client.session_transaction() as session:
+        session.shadow["shadow_value"] = 43
+        assert len(session.shadow) == 1
+        assert session.shadow.exists()
+        del session.shadow["shadow_value"]
+        assert len(session.shadow) == 0
+        assert not session.shadow.exists()
+
+
+def test_session_exists_expired_pending_delete(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow["shadow_value"] = 43
+
+    redis_client.delete(session.shadow.key)  # hash expired
+
+    with client.session_transaction() as session:
+        del session.shadow["shadow_value"]
+        assert not session.shadow.exists()
+
+    # Buffered delete is dropped with the hash rather than recreating it on save
+    assert "shadow_key" not in session
+    assert redis_client.keys() == []
+
+
+def test_session_field_max_age(client: FlaskClient, redis_client: FakeRedis, monkeypatch: pytest.MonkeyPatch) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    # fakeredis supports HEXPIRE but not the command introspection used to detect it
+    monkeypatch.setattr(shadowsession_module, "_supports_hexpire", lambda _redis: True)
+    monkeypatch.setattr(ShadowSessionDict, "field_max_age", {"_flashes": 60})
+
+    with client.session_transaction() as session:
+        session["_flashes"] = [("message", "This is a message")]
+        session.shadow["shadow_value"] = 43
+
+    key = session.shadow.key
+    assert 0 < redis_client.httl(key, "_flashes")[0] <= 60
+    assert redis_client.httl(key, "shadow_value")[0] == -1  # no field TTL, expires with the hash
+    assert redis_client.ttl(key) > 60
+
+
+def test_create_hash_reserves_key(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow["shadow_value"] = 43
+        key = session.shadow._create_hash()  # noqa: SLF001
+        # Key exists as soon as it is claimed, before the buffer is flushed
+        assert redis_client.exists(key)
+
+    with client.session_transaction() as session:
+        assert dict(session.shadow) == {"shadow_value": 43}
+
+
+def test_session_flush_sets_ttl(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow["a"] = 1
+
+    # Hash expires while the session cookie (and its TTL refresh time) is still fresh
+    redis_client.delete(session.shadow.key)
+
+    with client.session_transaction() as session:
+        session.shadow["b"] = 2
+        assert len(session.shadow) == 1
+
+    assert redis_client.ttl(session.shadow.key) > 0
+
+
+def test_force_shadow_fields() -> None:
+    class MySession(ShadowSession):
+        _force_shadow_fields = frozenset(("_flashes", "_user"))
+
+    for session_class, shadowed in ((ShadowSession, {"_flashes"}), (MySession, {"_flashes", "_user"})):
+        session = session_class()
+        for name in ("_flashes", "_user", "value"):
+            session[name] = 1
+
+        assert {name for name in ("_flashes", "_user", "value") if name in session.shadow} == shadowed
+        assert set(session.keys()) == {"_flashes", "_user", "value"} - shadowed
+
+
+def test_session_clear_delete(client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        session.shadow["shadow_value"] = 43
+
+    with client.session_transaction() as session:
+        key = session.shadow.key
+        session.clear()
+        session.shadow.delete()
+        assert "shadow_key" not in session
+
+    assert not redis_client.exists(key)
+
+
+def test_session_max_age_lifetime(app: Flask, client: FlaskClient, redis_client: FakeRedis) -> None:
+    ShadowSessionInterface.redis = redis_client
+
+    with client.session_transaction() as session:
+        assert session.shadow.max_age == 31 * 24 * 3600
+
+    # Cached TTL is recomputed when the configured lifetime changes
+    app.permanent_session_lifetime = timedelta(hours=1)
+    with client.session_transaction() as session:
+        assert session.shadow.max_age == 3600
+
+    app.config["PERMANENT_SESSION_LIFETIME"] = 60
+    with client.session_transaction() as session:
+        assert session.shadow.max_age == 60